@@ -37,7 +37,8 @@ class Auth:
 				password=None
 			)
 
-	def __init__(self):
+	def load_key(self):
+		"""Loads key from disk or generates a new one. It is slow and blocking, so run it in a thread on startup"""
 		assert os.access(os.path.split(config.KEYPAIR_FILENAME)[0], os.W_OK | os.R_OK | os.F_OK), \
 			"Key directory is unavailable"
 
@@ -0,0 +1,122 @@
+"""Performance benchmarks.
+
+Usage:
+`python bench.py db [writes] [reads]` - read/write throughput of every profile from config.DB_PROFILES,
+so you can pick DB_PROFILE knowingly
+`python bench.py startup` - time from importing main to readiness, with and without generating RSA key
+`python bench.py logging [posts] [reads]` - feed query cost with logging at INFO and DEBUG levels"""
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import config
+
+config.LOG_LEVEL = "WARNING"  # Logs would dominate timings
+
+
+async def bench_profile(profile: str, writes: int, reads: int) -> tuple[float, float]:
+	"""Returns (writes per second, feed reads per second) for a profile"""
+	import database
+
+	config.DB_PROFILE = profile
+	db = database.SQLiteDatabase()
+	await db.init_database()
+
+	start = time.perf_counter()
+	for i in range(writes):
+		await db.add_post("bench_user", "Bench title", f"Bench content #{i}")
+	write_time = time.perf_counter() - start
+
+	start = time.perf_counter()
+	for _ in range(reads):
+		await db.get_posts()
+	read_time = time.perf_counter() - start
+
+	await db.close()
+	return writes / write_time, reads / read_time
+
+
+async def bench_db(writes: int, reads: int):
+	print(f"{'profile':<10} {'writes/s':>10} {'feed reads/s':>14}")
+
+	for profile in config.DB_PROFILES:
+		with tempfile.TemporaryDirectory() as tmp:
+			config.DB_FILENAME = os.path.join(tmp, "bench.sqlite3")
+			writes_ps, reads_ps = await bench_profile(profile, writes, reads)
+		print(f"{profile:<10} {writes_ps:>10.1f} {reads_ps:>14.1f}")
+
+
+async def bench_logging(posts: int, reads: int):
+	"""Feed query (db.get_posts) is the hottest path with debug logs, records are written to devnull"""
+	import database
+	import log
+
+	with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+		config.DB_FILENAME = os.path.join(tmp, "bench.sqlite3")
+		db = database.SQLiteDatabase()
+		await db.init_database()
+		for i in range(posts):
+			await db.add_post("bench_user", "Bench title", f"Bench content #{i}")
+
+		print(f"{'level':<8} {'ms per feed':>12}")
+		for level in ("INFO", "DEBUG"):
+			config.LOG_LEVEL = level
+			log.setup_logging(devnull)
+
+			start = time.perf_counter()
+			for _ in range(reads):
+				await db.get_posts()
+			print(f"{level:<8} {(time.perf_counter() - start) / reads * 1000:>12.2f}")
+
+		log.stop_logging()  # Devnull is closed right after this block
+		logging.getLogger().handlers.clear()
+		await db.close()
+
+
+def startup_once(tmp: str):
+	"""Prints seconds from importing main to readiness. Must run in a fresh interpreter, so imports are not cached"""
+	start = time.perf_counter()
+	config.DB_FILENAME = os.path.join(tmp, "bench.sqlite3")
+	config.KEYPAIR_FILENAME = os.path.join(tmp, "key.pem")
+	import main
+
+	async def run() -> float:
+		await main.startup()
+		await main.init_task
+		elapsed = time.perf_counter() - start
+		await main.shutdown()
+		return elapsed
+
+	print(asyncio.run(run()))
+
+
+def bench_startup():
+	with tempfile.TemporaryDirectory() as tmp:
+		# First run has to generate RSA key, second one loads it from disk
+		for name in ("cold (new key)", "warm (key on disk)"):
+			out = subprocess.run([sys.executable, __file__, "_startup_once", tmp], capture_output=True, text=True, check=True).stdout
+			print(f"{name:<20} {float(out.split()[-1]) * 1000:>8.1f} ms to ready")
+
+
+if __name__ == "__main__":
+	bench = sys.argv[1] if len(sys.argv) > 1 else "db"
+
+	if bench == "db":
+		asyncio.run(bench_db(
+			int(sys.argv[2]) if len(sys.argv) > 2 else 1000,
+			int(sys.argv[3]) if len(sys.argv) > 3 else 100
+		))
+	elif bench == "startup":
+		bench_startup()
+	elif bench == "logging":
+		asyncio.run(bench_logging(
+			int(sys.argv[2]) if len(sys.argv) > 2 else config.POST_MAX_RECEIVE_LIMIT,
+			int(sys.argv[3]) if len(sys.argv) > 3 else 100
+		))
+	elif bench == "_startup_once":
+		startup_once(sys.argv[2])
+	else:
+		print(__doc__)
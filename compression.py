@@ -0,0 +1,115 @@
+import config
+import events
+import gzip
+import time
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+	import brotli
+except ImportError:  # Brotli is optional, only gzip is used without it
+	brotli = None
+
+
+def negotiate(accept_encoding: str) -> str | None:
+	"""Returns first encoding from config.COMPRESSION_ENCODINGS accepted by client, None if there is no such"""
+	accepted = set()
+	for item in accept_encoding.split(","):
+		name, _, params = item.strip().partition(";")
+		if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+			continue
+		accepted.add(name.strip().lower())
+
+	for encoding in config.COMPRESSION_ENCODINGS:
+		if encoding == "br" and not brotli:
+			continue
+		if encoding in accepted or "*" in accepted:
+			return encoding
+	return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+	if encoding == "br":
+		return brotli.compress(data, quality=config.COMPRESSION_BROTLI_QUALITY)
+	return gzip.compress(data, compresslevel=config.COMPRESSION_GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+	"""Compresses responses of at least config.COMPRESSION_MIN_SIZE bytes. Streaming responses and responses
+	which are already encoded (e.g. cached feed) are passed as is. Event streams are passed right away,
+	since their first event may come much later than headers"""
+
+	def __init__(self, app):
+		self.app = app
+
+	async def __call__(self, scope, receive, send):
+		if scope["type"] != "http":
+			await self.app(scope, receive, send)
+			return
+
+		encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+		if not encoding:
+			await self.app(scope, receive, send)
+			return
+
+		start_message = None
+
+		async def send_compressed(message):
+			nonlocal start_message
+			if message["type"] == "http.response.start":
+				if Headers(raw=message.get("headers", [])).get("content-type", "").startswith("text/event-stream"):
+					await send(message)
+					return
+				start_message = message  # Headers are sent with the body, when we know if it gets compressed
+				return
+
+			if message["type"] == "http.response.body" and start_message:
+				start, start_message = start_message, None
+				headers = MutableHeaders(scope=start)
+				body = message.get("body", b"")
+
+				if not message.get("more_body") and "content-encoding" not in headers and len(body) >= config.COMPRESSION_MIN_SIZE:
+					body = compress(body, encoding)
+					headers["Content-Encoding"] = encoding
+					headers["Content-Length"] = str(len(body))
+					headers.add_vary_header("Accept-Encoding")
+					message = {"type": "http.response.body", "body": body}
+
+				await send(start)
+
+			await send(message)
+
+		await self.app(scope, receive, send_compressed)
+
+
+class FeedCache:
+	"""Serialized and compressed /posts/get_all payloads of the default limit, one per encoding.
+	Entry is valid until any post or rate changes, which is tracked by events.hub.version, and for at most
+	config.FEED_CACHE_TTL_SECONDS, since changes made by other workers/hosts don't bump local version"""
+
+	def __init__(self):
+		self.entries: dict[str | None, tuple[int, float, bytes, str | None]] = {}  # encoding: (version, created, body, used encoding)
+
+	def get(self, limit: int | None, encoding: str | None) -> tuple[bytes, str | None] | None:
+		if limit != config.POST_MAX_RECEIVE_LIMIT:
+			return None
+
+		entry = self.entries.get(encoding)
+		if not entry or entry[0] != events.hub.version or time.monotonic() - entry[1] >= config.FEED_CACHE_TTL_SECONDS:
+			return None
+		return entry[2], entry[3]
+
+	def put(self, version: int, limit: int | None, encoding: str | None, body: bytes) -> tuple[bytes, str | None]:
+		"""Compresses body if it is big enough and caches it, unless limit is not the default one or posts changed
+		since `version` was taken before fetching. Returns (body, used encoding)"""
+		used_encoding = encoding if encoding and len(body) >= config.COMPRESSION_MIN_SIZE else None
+		if used_encoding:
+			body = compress(body, used_encoding)
+
+		if limit == config.POST_MAX_RECEIVE_LIMIT and events.hub.version == version:
+			if any(entry[0] != version for entry in self.entries.values()):
+				self.entries.clear()  # Dropping payloads of older versions of other encodings
+			self.entries[encoding] = (version, time.monotonic(), body, used_encoding)
+		return body, used_encoding
+
+
+feed_cache = FeedCache()
@@ -1,19 +1,18 @@
 import aiosqlite as sq3
-from builtins import print as _print
+import logging
 import sqlite3 as _sq3
 import config
 import dataclasses
 import enum
 import utils
+import events
+import ranking
 import json
 import time
-from typing import Tuple
+from typing import Tuple, Protocol
 
 
-if config.DEBUG:
-	print = lambda *args, **kwargs: _print('\033[96m debug *', *args, '\033[0m', **kwargs)
-else:
-	print = lambda *args, **kwargs: None
+logger = logging.getLogger(__name__)
 
 
 @dataclasses.dataclass
@@ -36,6 +35,14 @@ class Post:
 	liked_nicknames: list[str]
 	disliked_nicknames: list[str]
 
+	def rate_of(self, nickname: str) -> bool | None:
+		"""Returns rate of user on this post, None if user did not rate it"""
+		if nickname in self.liked_nicknames:
+			return True
+		elif nickname in self.disliked_nicknames:
+			return False
+		return None
+
 
 class AddStatus(enum.Enum):
 	OK = 1
@@ -72,7 +79,47 @@ class EditStatus(enum.Enum):
 	ERROR = 6
 
 
-class Database:
+class Database(Protocol):
+	"""Storage backend interface. Every backend must implement these methods with the same statuses
+	as SQLiteDatabase and only store data, hot ranking and events are updated by NotifyingDatabase.
+	Use create_database() to get the one configured by config.DB_BACKEND"""
+
+	async def init_database(self): ...
+
+	async def check_token_expired(self, token: str) -> tuple[int, int] | None: ...
+
+	async def expire_token(self, token: str): ...
+
+	async def clean_expired_tokens(self): ...
+
+	async def add_user(self, user: User) -> AddStatus: ...
+
+	async def get_user(self, nickname: str) -> Tuple[User | None, FetchStatus]: ...
+
+	async def add_post(self, author_nickname: str, title: str, content: str) -> tuple[Post | None, AddStatus]: ...
+
+	async def get_post(self, id_: int) -> Tuple[Post | None, FetchStatus]: ...
+
+	async def get_posts(self, limit: int | None = config.POST_MAX_RECEIVE_LIMIT) -> tuple[list[Post] | None, FetchStatus]: ...
+
+	async def get_posts_by_ids(self, ids: list[int]) -> tuple[list[tuple[int, Post | None, FetchStatus]] | None, FetchStatus]: ...
+
+	async def get_post_scores(self, since_ts: int) -> list[tuple[int, int, int, int]]: ...
+
+	async def get_rate_counts(self, post_id: int) -> tuple[int, int]: ...
+
+	async def edit_post(self, post_id: int, nickname: str, new_title: str = None, new_content: str = None) -> EditStatus: ...
+
+	async def delete_post(self, post_id: int, nickname: str) -> EditStatus: ...
+
+	async def set_rate(self, post_id: int, nickname: str, is_like: bool) -> tuple[bool | None, RateStatus]: ...
+
+	async def unset_rate(self, post_id: int, nickname: str) -> tuple[bool | None, RateStatus]: ...
+
+	async def close(self): ...
+
+
+class SQLiteDatabase:
 	db = sq3.Connection
 	__initialized = False
 
@@ -80,26 +127,30 @@ class Database:
 		if self.__initialized:
 			return
 
-		self.db = await sq3.connect(config.DB_FILENAME, detect_types=_sq3.PARSE_DECLTYPES | _sq3.PARSE_COLNAMES, isolation_level=None)
-
-		# Creating users table
-		await (await self.db.execute(
-			"CREATE TABLE IF NOT EXISTS users(nickname TEXT UNIQUE, password BLOB, salt BLOB)"
-		)).close()
-
-		await (await self.db.execute(
-			"CREATE TABLE IF NOT EXISTS posts(id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, author_nickname TEXT NOT NULL, title TEXT, content TEXT, ts_posted INTEGER)"
+		self.db = await sq3.connect(config.DB_FILENAME, detect_types=_sq3.PARSE_DECLTYPES | _sq3.PARSE_COLNAMES, isolation_level=None,
+		                            cached_statements=config.DB_STATEMENT_CACHE_SIZE)
+		await self.__apply_profile()
+
+		# Creating all tables in one script instead of a statement per table
+		await (await self.db.executescript(
+			"CREATE TABLE IF NOT EXISTS users(nickname TEXT UNIQUE, password BLOB, salt BLOB);"
+			"CREATE TABLE IF NOT EXISTS posts(id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, author_nickname TEXT NOT NULL, title TEXT, content TEXT, ts_posted INTEGER);"
+			"CREATE TABLE IF NOT EXISTS post_rates(post_id INTEGER NOT NULL, is_like BOOL, nickname TEXT);"
+			"CREATE TABLE IF NOT EXISTS expired_tokens(token TEXT UNIQUE NOT NULL, expire_ts INTEGER NOT NULL);"
+			"CREATE INDEX IF NOT EXISTS post_rates_post_id ON post_rates(post_id);"
+			"CREATE INDEX IF NOT EXISTS posts_ts_posted ON posts(ts_posted);"
+			"CREATE TRIGGER IF NOT EXISTS post_rates_cascade AFTER DELETE ON posts BEGIN DELETE FROM post_rates WHERE post_id = OLD.id; END;"
 		)).close()
 
-		await (await self.db.execute(
-			"CREATE TABLE IF NOT EXISTS post_rates(post_id INTEGER NOT NULL, is_like BOOL, nickname TEXT)"
-		)).close()
+		self.__initialized = True
 
-		await (await self.db.execute(
-			"CREATE TABLE IF NOT EXISTS expired_tokens(token TEXT UNIQUE NOT NULL, expire_ts INTEGER NOT NULL)"
-		)).close()
+	async def __apply_profile(self):
+		"""Applies PRAGMAs of config.DB_PROFILE to the opened connection"""
+		assert config.DB_PROFILE in config.DB_PROFILES, f"Unknown DB_PROFILE: {config.DB_PROFILE}"
 
-		self.__initialized = True
+		for pragma, value in config.DB_PROFILES[config.DB_PROFILE].items():
+			await (await self.db.execute(f"PRAGMA {pragma} = {value}")).close()  # PRAGMA does not support placeholders
+		logger.debug("applied db profile %s", config.DB_PROFILE)
 
 	def __check_initialized(self):
 		assert self.__initialized, "Database is not initialized, run init_database() first"
@@ -150,34 +201,27 @@ class Database:
 
 		return User(nickname=data[0], password=data[1], salt=data[2]), FetchStatus.OK
 
-	async def add_post(self, author: User, title: str, content: str) -> tuple[int | None, AddStatus]:
-		"""Returns added post_id and addstatus if successful. If err occures, first value of return tuple will be None"""
+	async def add_post(self, author_nickname: str, title: str, content: str) -> tuple[Post | None, AddStatus]:
+		"""Returns added post and addstatus if successful. If err occures, first value of return tuple will be None.
+		Post id is taken from the insert itself (lastrowid), so concurrent posts never get the same id"""
 		self.__check_initialized()
 		if not utils.check_post(title, content):
 			return None, AddStatus.INVALID_POST
 		try:
-			c = await self.db.cursor()
 			current_time = time.time().__round__()
-			await c.execute("SELECT MAX(id) FROM posts")
-			max_id = await c.fetchone()
-			if max_id[0]:
-				print(max_id)
-				next_post_id = max_id[0] + 1
-			else:
-				next_post_id = 1
-
-			await c.execute("INSERT INTO posts(author_nickname, title, content, ts_posted) VALUES (?, ?, ?, ?)", (author.nickname, title, content, current_time))
+			c = await self.db.execute("INSERT INTO posts(author_nickname, title, content, ts_posted) VALUES (?, ?, ?, ?)", (author_nickname, title, content, current_time))
+			post_id = c.lastrowid
 			await c.close()
 		except sq3.ProgrammingError:
 			return None, AddStatus.UNSUPPORTED_SYMBOLS
 		except sq3.Error:
 			return None, AddStatus.UNKNOWN_ERROR
 
-		return next_post_id, AddStatus.OK
+		return Post(post_id, author_nickname, title, content, current_time, [], []), AddStatus.OK
 
 	async def _get_post_rates(self, id_: int, nickname: str = None) -> tuple[list[str], list[str]] | None:
 		if not utils.check_id(id_):
-			print("bad id")
+			logger.debug("bad post id %s", id_)
 			return
 
 		c = await self.db.cursor()
@@ -239,15 +283,70 @@ class Database:
 		posts = []
 
 		for data in await c.fetchall():
-			print(data)
-			rates = await self._get_post_rates(data[0])
-			print(rates)
-			like_nicknames, dislike_nicknames = rates  # NOTE
+			like_nicknames, dislike_nicknames = await self._get_post_rates(data[0])
+			logger.debug("fetched post %s, likes %s, dislikes %s", data, like_nicknames, dislike_nicknames)
 			posts.append(Post(data[0], data[1], data[2], data[3], data[4], like_nicknames, dislike_nicknames))
 		await c.close()
 
 		return posts, FetchStatus.OK
 
+	async def get_posts_by_ids(self, ids: list[int]) -> tuple[list[tuple[int, Post | None, FetchStatus]] | None, FetchStatus]:
+		"""Fetches posts with all their rates in two queries. Returns (id, post, status) for each requested id
+		in the same order, post is None if its status is not OK"""
+		if not 1 <= len(ids) <= config.POST_MAX_IDS_PER_REQUEST:
+			return None, FetchStatus.INCORRECT_LIMIT
+
+		valid_ids = list({id_ for id_ in ids if utils.check_id(id_)})
+		posts = {}
+
+		if valid_ids:
+			try:
+				c = await self.db.execute("SELECT id, author_nickname, title, content, ts_posted FROM posts WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(valid_ids),))
+				for data in await c.fetchall():
+					posts[data[0]] = Post(data[0], data[1], data[2], data[3], data[4], [], [])
+
+				await c.execute("SELECT post_id, is_like, nickname FROM post_rates WHERE post_id IN (SELECT value FROM json_each(?))", (json.dumps(valid_ids),))
+				for post_id, is_like, nickname in await c.fetchall():
+					if post_id in posts:
+						(posts[post_id].liked_nicknames if is_like else posts[post_id].disliked_nicknames).append(nickname)
+				await c.close()
+			except sq3.Error:
+				return None, FetchStatus.UNKNOWN_ERROR
+
+		return [
+			(id_, posts[id_], FetchStatus.OK) if id_ in posts else
+			(id_, None, FetchStatus.POST_DOES_NOT_EXIST if utils.check_id(id_) else FetchStatus.INCORRECT_ID)
+			for id_ in ids
+		], FetchStatus.OK
+
+	async def get_post_scores(self, since_ts: int) -> list[tuple[int, int, int, int]]:
+		"""Returns (post_id, ts_posted, likes, dislikes) of every post posted since `since_ts`, used to build ranking.HotIndex"""
+		c = await self.db.execute(
+			"SELECT p.id, p.ts_posted, COUNT(r.post_id) FILTER (WHERE r.is_like), COUNT(r.post_id) FILTER (WHERE NOT r.is_like) "
+			"FROM posts p LEFT JOIN post_rates r ON r.post_id = p.id WHERE p.ts_posted >= ? GROUP BY p.id",
+			(since_ts,)
+		)
+		rows = await c.fetchall()
+		await c.close()
+
+		return [tuple(row) for row in rows]
+
+	async def get_rate_counts(self, post_id: int) -> tuple[int, int]:
+		"""Returns (likes, dislikes) of a post"""
+		c = await self.db.execute("SELECT COUNT(*) FILTER (WHERE is_like), COUNT(*) FILTER (WHERE NOT is_like) FROM post_rates WHERE post_id = ?", (post_id,))
+		likes, dislikes = await c.fetchone()
+		await c.close()
+
+		return likes, dislikes
+
+	async def __missing_post_status(self, post_id: int) -> EditStatus:
+		"""Explains why an ownership-guarded statement affected no rows"""
+		c = await self.db.execute("SELECT 1 FROM posts WHERE id = ?", (post_id,))
+		exists = await c.fetchone()
+		await c.close()
+
+		return EditStatus.NO_ACCESS if exists else EditStatus.NO_POST
+
 	async def edit_post(self, post_id: int, nickname: str, new_title: str = None, new_content: str = None) -> EditStatus:
 		if not new_title and not new_content:
 			return EditStatus.OK
@@ -258,22 +357,19 @@ class Database:
 		if not utils.check_id(post_id):
 			return EditStatus.INCORRECT_ID
 
-		post, fetch_status = await self.get_post(post_id)
-		if fetch_status != FetchStatus.OK:
-			return EditStatus.NO_POST
-
-		if post.author_nickname != nickname:
-			return EditStatus.NO_ACCESS
+		try:
+			# Ownership is checked by the statement itself, COALESCE keeps the old value for the part that was not passed
+			c = await self.db.execute(
+				"UPDATE posts SET title = COALESCE(?, title), content = COALESCE(?, content) WHERE id = ? AND author_nickname = ?",
+				(new_title or None, new_content or None, post_id, nickname)
+			)
+			edited = c.rowcount
+			await c.close()
 
-		c = await self.db.cursor()
-		if new_title and new_content:
-			await c.execute("UPDATE posts SET title = ?, content = ? WHERE id = ?", (new_title, new_content, post_id))
-		elif new_title:
-			await c.execute("UPDATE posts SET title = ? WHERE id = ?", (new_title, post_id))
-		else:
-			await c.execute("UPDATE posts SET content = ? WHERE id = ?", (new_content, post_id))  # I know i could do this
-			# easier way, but im too cautious ya know ;)
-		await c.close()
+			if not edited:
+				return await self.__missing_post_status(post_id)
+		except sq3.Error:
+			return EditStatus.ERROR
 
 		return EditStatus.OK
 
@@ -281,58 +377,127 @@ class Database:
 		if not utils.check_id(post_id):
 			return EditStatus.INCORRECT_ID
 
-		post, fetch_status = await self.get_post(post_id)
-		if fetch_status != FetchStatus.OK:
-			return EditStatus.NO_POST
-
-		if post.author_nickname != nickname:
-			return EditStatus.NO_ACCESS
+		try:
+			# Rates of the post are removed by post_rates_cascade trigger within the same statement
+			c = await self.db.execute("DELETE FROM posts WHERE id = ? AND author_nickname = ?", (post_id, nickname))
+			deleted = c.rowcount
+			await c.close()
 
-		c = await self.db.cursor()
-		await c.execute("DELETE FROM posts WHERE id = ?", (post_id, ))
-		await c.execute("DELETE FROM post_rates WHERE post_id = ?", (post_id,))
-		await c.close()
+			if not deleted:
+				return await self.__missing_post_status(post_id)
+		except sq3.Error:
+			return EditStatus.ERROR
 
 		return EditStatus.OK
 
-	async def set_rate(self, post_id: int, nickname: str, is_like: bool) -> RateStatus:
+	async def set_rate(self, post_id: int, nickname: str, is_like: bool) -> tuple[bool | None, RateStatus]:
+		"""Returns previous rate of the user (None if there was none) and status"""
 		post, fetch_status = await self.get_post(post_id)
 		if fetch_status == FetchStatus.POST_DOES_NOT_EXIST:
-			return RateStatus.NO_POST
+			return None, RateStatus.NO_POST
 		elif fetch_status == FetchStatus.UNKNOWN_ERROR:
-			return RateStatus.ERROR
+			return None, RateStatus.ERROR
 
 		if post.author_nickname == nickname:
-			return RateStatus.NO_ACCESS
+			return None, RateStatus.NO_ACCESS
 
+		old_is_like = post.rate_of(nickname)
 		c = await self.db.cursor()
 
-		rates = await self._get_post_rates(post_id, nickname)
-
-		if not rates[0] and not rates[1]:  # User did not like or dislike this post
+		if old_is_like is None:  # User did not like or dislike this post
 			await c.execute("INSERT INTO post_rates(post_id, is_like, nickname) VALUES (?, ?, ?)", (post_id, is_like, nickname))
 		else:
 			await c.execute("UPDATE post_rates SET is_like = ? WHERE post_id = ? AND nickname = ?",  # Updating his rate
 			                (is_like, post_id, nickname))
 		await c.close()
 
-		return RateStatus.OK
+		return old_is_like, RateStatus.OK
 
-	async def unset_rate(self, post_id: int, nickname: str) -> RateStatus:
+	async def unset_rate(self, post_id: int, nickname: str) -> tuple[bool | None, RateStatus]:
+		"""Returns previous rate of the user (None if there was none) and status"""
 		post, fetch_status = await self.get_post(post_id)
 		if fetch_status == FetchStatus.POST_DOES_NOT_EXIST:
-			return RateStatus.NO_POST
+			return None, RateStatus.NO_POST
 		elif fetch_status == FetchStatus.UNKNOWN_ERROR:
-			return RateStatus.ERROR
+			return None, RateStatus.ERROR
 
 		if post.author_nickname == nickname:
-			return RateStatus.NO_ACCESS
+			return None, RateStatus.NO_ACCESS
 
 		c = await self.db.cursor()
 		await c.execute("DELETE FROM post_rates WHERE post_id = ? AND nickname = ?", (post_id, nickname))
 		await c.close()
 
-		return RateStatus.OK
+		return post.rate_of(nickname), RateStatus.OK
 
 	async def close(self):
-		await self.db.close()
+		if isinstance(self.db, sq3.Connection):  # Not connected yet, if it is still the class placeholder
+			await self.db.close()
+
+
+class NotifyingDatabase:
+	"""Wraps any Database backend and reports its successful writes to ranking.hot and events.hub,
+	so backends stay pure storage and a new backend can't break live feed, hot ranking or feed cache.
+	Reads are passed to the backend as is"""
+
+	def __init__(self, backend: Database):
+		self.backend = backend
+
+	def __getattr__(self, name: str):
+		return getattr(self.backend, name)
+
+	async def add_post(self, author_nickname: str, title: str, content: str) -> tuple[Post | None, AddStatus]:
+		post, add_status = await self.backend.add_post(author_nickname, title, content)
+		if add_status == AddStatus.OK:
+			ranking.hot.add_post(post.id_, post.posted_ts)
+			events.hub.publish("post_new", dataclasses.asdict(post))
+		return post, add_status
+
+	async def edit_post(self, post_id: int, nickname: str, new_title: str = None, new_content: str = None) -> EditStatus:
+		edit_status = await self.backend.edit_post(post_id, nickname, new_title, new_content)
+		if edit_status == EditStatus.OK and (new_title or new_content):
+			ranking.hot.edit_post(post_id)
+			events.hub.publish("post_edit", {"id_": post_id, "title": new_title or None, "content": new_content or None})
+		return edit_status
+
+	async def delete_post(self, post_id: int, nickname: str) -> EditStatus:
+		edit_status = await self.backend.delete_post(post_id, nickname)
+		if edit_status == EditStatus.OK:
+			ranking.hot.delete_post(post_id)
+			events.hub.publish("post_delete", {"id_": post_id})
+		return edit_status
+
+	async def set_rate(self, post_id: int, nickname: str, is_like: bool) -> tuple[bool | None, RateStatus]:
+		old_is_like, rate_status = await self.backend.set_rate(post_id, nickname, is_like)
+		if rate_status == RateStatus.OK:
+			ranking.hot.rate(post_id, old_is_like, is_like)
+			await self.__publish_rates(post_id)
+		return old_is_like, rate_status
+
+	async def unset_rate(self, post_id: int, nickname: str) -> tuple[bool | None, RateStatus]:
+		old_is_like, rate_status = await self.backend.unset_rate(post_id, nickname)
+		if rate_status == RateStatus.OK:
+			ranking.hot.rate(post_id, old_is_like, None)
+			await self.__publish_rates(post_id)
+		return old_is_like, rate_status
+
+	async def __publish_rates(self, post_id: int):
+		"""Publishes new like/dislike counts of a post, counting is skipped if nobody listens"""
+		if not events.hub.has_subscribers():
+			events.hub.changed()
+			return
+
+		likes, dislikes = await self.backend.get_rate_counts(post_id)
+		events.hub.publish("post_rates", {"id_": post_id, "likes": likes, "dislikes": dislikes})
+
+
+def create_database() -> Database:
+	"""Returns backend selected by config.DB_BACKEND wrapped into NotifyingDatabase,
+	it still has to be initialized with init_database()"""
+	if config.DB_BACKEND == "sqlite":
+		return NotifyingDatabase(SQLiteDatabase())
+	elif config.DB_BACKEND == "postgres":
+		import database_postgres  # asyncpg is only required when postgres backend is used
+		return NotifyingDatabase(database_postgres.PostgresDatabase())
+
+	raise ValueError(f"Unknown DB_BACKEND: {config.DB_BACKEND}")
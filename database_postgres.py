@@ -0,0 +1,287 @@
+import asyncpg
+import logging
+import config
+import utils
+import time
+from typing import Tuple
+from database import User, Post, AddStatus, FetchStatus, RateStatus, EditStatus
+
+
+logger = logging.getLogger(__name__)
+
+
+# Errors raised when passed text can not be stored (e.g. null bytes or surrogates)
+_UNSUPPORTED_SYMBOLS_ERRORS = (asyncpg.DataError, UnicodeEncodeError)
+
+
+class PostgresDatabase:
+	"""PostgreSQL backend based on asyncpg pool, behaves the same way as database.SQLiteDatabase"""
+	pool: asyncpg.Pool | None = None
+	__initialized = False
+
+	async def init_database(self):
+		if self.__initialized:
+			return
+
+		self.pool = await asyncpg.create_pool(config.POSTGRES_DSN, min_size=config.POSTGRES_POOL_MIN_SIZE, max_size=config.POSTGRES_POOL_MAX_SIZE)
+
+		await self.pool.execute(
+			"CREATE TABLE IF NOT EXISTS users(nickname TEXT UNIQUE, password BYTEA, salt BYTEA);"
+			"CREATE TABLE IF NOT EXISTS posts(id BIGSERIAL PRIMARY KEY, author_nickname TEXT NOT NULL, title TEXT, content TEXT, ts_posted BIGINT);"
+			"CREATE TABLE IF NOT EXISTS post_rates(post_id BIGINT NOT NULL, is_like BOOLEAN, nickname TEXT);"
+			"CREATE TABLE IF NOT EXISTS expired_tokens(token TEXT UNIQUE NOT NULL, expire_ts DOUBLE PRECISION NOT NULL);"
+			"CREATE INDEX IF NOT EXISTS post_rates_post_id ON post_rates(post_id);"
+			"CREATE INDEX IF NOT EXISTS posts_ts_posted ON posts(ts_posted);"
+		)
+
+		self.__initialized = True
+
+	def __check_initialized(self):
+		assert self.__initialized, "Database is not initialized, run init_database() first"
+
+	async def check_token_expired(self, token: str) -> tuple[int, int] | None:
+		"""Returns None if token is not expired and (timestamp,) if it is"""
+		d = await self.pool.fetchrow("SELECT expire_ts FROM expired_tokens WHERE token = $1", token)
+
+		return tuple(d) if d else None
+
+	async def expire_token(self, token: str):
+		await self.pool.execute("INSERT INTO expired_tokens(token, expire_ts) VALUES ($1, $2) ON CONFLICT DO NOTHING", token, time.time())
+
+	async def clean_expired_tokens(self):
+		await self.pool.execute("DELETE FROM expired_tokens WHERE expire_ts <= $1", time.time())
+
+	async def add_user(self, user: User) -> AddStatus:
+		self.__check_initialized()
+
+		if not utils.check_nickname(user.nickname):
+			return AddStatus.NICKNAME_TOO_LONG
+
+		try:
+			await self.pool.execute("INSERT INTO users(nickname, password, salt) VALUES ($1, $2, $3)", user.nickname, user.password, user.salt)
+			return AddStatus.OK
+		except asyncpg.UniqueViolationError:
+			return AddStatus.USER_EXISTS
+		except _UNSUPPORTED_SYMBOLS_ERRORS:
+			return AddStatus.UNSUPPORTED_SYMBOLS
+		except asyncpg.PostgresError:
+			return AddStatus.UNKNOWN_ERROR
+
+	async def get_user(self, nickname: str) -> Tuple[User | None, FetchStatus]:
+		self.__check_initialized()
+
+		try:
+			data = await self.pool.fetchrow("SELECT nickname, password, salt FROM users WHERE nickname = $1", nickname)
+		except _UNSUPPORTED_SYMBOLS_ERRORS:
+			return None, FetchStatus.UNSUPPORTED_SYMBOLS
+
+		if not data:
+			return None, FetchStatus.USER_DOES_NOT_EXIST
+
+		return User(nickname=data[0], password=data[1], salt=data[2]), FetchStatus.OK
+
+	async def add_post(self, author_nickname: str, title: str, content: str) -> tuple[Post | None, AddStatus]:
+		"""Returns added post and addstatus if successful. If err occures, first value of return tuple will be None"""
+		self.__check_initialized()
+		if not utils.check_post(title, content):
+			return None, AddStatus.INVALID_POST
+		try:
+			current_time = time.time().__round__()
+			post_id = await self.pool.fetchval(
+				"INSERT INTO posts(author_nickname, title, content, ts_posted) VALUES ($1, $2, $3, $4) RETURNING id",
+				author_nickname, title, content, current_time
+			)
+		except _UNSUPPORTED_SYMBOLS_ERRORS:
+			return None, AddStatus.UNSUPPORTED_SYMBOLS
+		except asyncpg.PostgresError:
+			return None, AddStatus.UNKNOWN_ERROR
+
+		return Post(post_id, author_nickname, title, content, current_time, [], []), AddStatus.OK
+
+	async def _get_post_rates(self, id_: int, nickname: str = None) -> tuple[list[str], list[str]] | None:
+		if not utils.check_id(id_):
+			logger.debug("bad post id %s", id_)
+			return
+
+		if not nickname:
+			rates = await self.pool.fetch("SELECT is_like, nickname FROM post_rates WHERE post_id = $1", id_)
+		else:
+			rates = await self.pool.fetch("SELECT is_like, nickname FROM post_rates WHERE post_id = $1 AND nickname = $2", id_, nickname)
+
+		like_nicknames = []
+		dislike_nicknames = []
+		for is_like, rate_nickname in rates:
+			if is_like:
+				like_nicknames.append(rate_nickname)
+			else:
+				dislike_nicknames.append(rate_nickname)
+
+		return like_nicknames, dislike_nicknames
+
+	async def get_post(self, id_: int) -> Tuple[Post | None, FetchStatus]:
+		self.__check_initialized()
+
+		if not utils.check_id(id_):
+			return None, FetchStatus.INCORRECT_ID
+
+		try:
+			data = await self.pool.fetchrow("SELECT author_nickname, title, content, ts_posted FROM posts WHERE id = $1", id_)
+
+			if not data:
+				return None, FetchStatus.POST_DOES_NOT_EXIST
+
+			like_nicknames, dislike_nicknames = await self._get_post_rates(id_)
+
+			return Post(id_, data[0], data[1], data[2], data[3], like_nicknames, dislike_nicknames), FetchStatus.OK
+		except _UNSUPPORTED_SYMBOLS_ERRORS:
+			return None, FetchStatus.UNSUPPORTED_SYMBOLS
+		except asyncpg.PostgresError:
+			return None, FetchStatus.UNKNOWN_ERROR
+
+	async def get_posts(self, limit: int | None = config.POST_MAX_RECEIVE_LIMIT) -> tuple[list[Post] | None, FetchStatus]:
+		if limit and not 1 <= limit <= config.POST_MAX_RECEIVE_LIMIT:
+			return None, FetchStatus.INCORRECT_LIMIT
+
+		if limit:
+			rows = await self.pool.fetch("SELECT id, author_nickname, title, content, ts_posted FROM posts ORDER BY id DESC LIMIT $1", limit)
+		else:
+			rows = await self.pool.fetch("SELECT id, author_nickname, title, content, ts_posted FROM posts ORDER BY id DESC")
+
+		posts = []
+
+		for data in rows:
+			like_nicknames, dislike_nicknames = await self._get_post_rates(data[0])
+			posts.append(Post(data[0], data[1], data[2], data[3], data[4], like_nicknames, dislike_nicknames))
+
+		return posts, FetchStatus.OK
+
+	async def get_posts_by_ids(self, ids: list[int]) -> tuple[list[tuple[int, Post | None, FetchStatus]] | None, FetchStatus]:
+		"""Fetches posts with all their rates in two queries. Returns (id, post, status) for each requested id
+		in the same order, post is None if its status is not OK"""
+		if not 1 <= len(ids) <= config.POST_MAX_IDS_PER_REQUEST:
+			return None, FetchStatus.INCORRECT_LIMIT
+
+		valid_ids = list({id_ for id_ in ids if utils.check_id(id_)})
+		posts = {}
+
+		if valid_ids:
+			try:
+				for data in await self.pool.fetch("SELECT id, author_nickname, title, content, ts_posted FROM posts WHERE id = ANY($1::bigint[])", valid_ids):
+					posts[data[0]] = Post(data[0], data[1], data[2], data[3], data[4], [], [])
+
+				for post_id, is_like, nickname in await self.pool.fetch("SELECT post_id, is_like, nickname FROM post_rates WHERE post_id = ANY($1::bigint[])", valid_ids):
+					if post_id in posts:
+						(posts[post_id].liked_nicknames if is_like else posts[post_id].disliked_nicknames).append(nickname)
+			except asyncpg.PostgresError:
+				return None, FetchStatus.UNKNOWN_ERROR
+
+		return [
+			(id_, posts[id_], FetchStatus.OK) if id_ in posts else
+			(id_, None, FetchStatus.POST_DOES_NOT_EXIST if utils.check_id(id_) else FetchStatus.INCORRECT_ID)
+			for id_ in ids
+		], FetchStatus.OK
+
+	async def get_post_scores(self, since_ts: int) -> list[tuple[int, int, int, int]]:
+		"""Returns (post_id, ts_posted, likes, dislikes) of every post posted since `since_ts`, used to build ranking.HotIndex"""
+		rows = await self.pool.fetch(
+			"SELECT p.id, p.ts_posted, COUNT(r.post_id) FILTER (WHERE r.is_like), COUNT(r.post_id) FILTER (WHERE NOT r.is_like) "
+			"FROM posts p LEFT JOIN post_rates r ON r.post_id = p.id WHERE p.ts_posted >= $1 GROUP BY p.id",
+			since_ts
+		)
+
+		return [tuple(row) for row in rows]
+
+	async def get_rate_counts(self, post_id: int) -> tuple[int, int]:
+		"""Returns (likes, dislikes) of a post"""
+		likes, dislikes = await self.pool.fetchrow("SELECT COUNT(*) FILTER (WHERE is_like), COUNT(*) FILTER (WHERE NOT is_like) FROM post_rates WHERE post_id = $1", post_id)
+
+		return likes, dislikes
+
+	async def __missing_post_status(self, post_id: int) -> EditStatus:
+		"""Explains why an ownership-guarded statement affected no rows"""
+		exists = await self.pool.fetchval("SELECT 1 FROM posts WHERE id = $1", post_id)
+
+		return EditStatus.NO_ACCESS if exists else EditStatus.NO_POST
+
+	async def edit_post(self, post_id: int, nickname: str, new_title: str = None, new_content: str = None) -> EditStatus:
+		if not new_title and not new_content:
+			return EditStatus.OK
+
+		if not utils.check_post(new_title, new_content):
+			return EditStatus.INVALID_POST
+
+		if not utils.check_id(post_id):
+			return EditStatus.INCORRECT_ID
+
+		try:
+			# Ownership is checked by the statement itself, COALESCE keeps the old value for the part that was not passed
+			result = await self.pool.execute(
+				"UPDATE posts SET title = COALESCE($1, title), content = COALESCE($2, content) WHERE id = $3 AND author_nickname = $4",
+				new_title or None, new_content or None, post_id, nickname
+			)
+
+			if result == "UPDATE 0":
+				return await self.__missing_post_status(post_id)
+		except asyncpg.PostgresError:
+			return EditStatus.ERROR
+
+		return EditStatus.OK
+
+	async def delete_post(self, post_id: int, nickname: str) -> EditStatus:
+		if not utils.check_id(post_id):
+			return EditStatus.INCORRECT_ID
+
+		try:
+			# Post and its rates are deleted by one atomic statement
+			deleted = await self.pool.fetchval(
+				"WITH deleted AS (DELETE FROM posts WHERE id = $1 AND author_nickname = $2 RETURNING id), "
+				"rates AS (DELETE FROM post_rates WHERE post_id IN (SELECT id FROM deleted)) "
+				"SELECT COUNT(*) FROM deleted",
+				post_id, nickname
+			)
+
+			if not deleted:
+				return await self.__missing_post_status(post_id)
+		except asyncpg.PostgresError:
+			return EditStatus.ERROR
+
+		return EditStatus.OK
+
+	async def set_rate(self, post_id: int, nickname: str, is_like: bool) -> tuple[bool | None, RateStatus]:
+		"""Returns previous rate of the user (None if there was none) and status"""
+		post, fetch_status = await self.get_post(post_id)
+		if fetch_status == FetchStatus.POST_DOES_NOT_EXIST:
+			return None, RateStatus.NO_POST
+		elif fetch_status == FetchStatus.UNKNOWN_ERROR:
+			return None, RateStatus.ERROR
+
+		if post.author_nickname == nickname:
+			return None, RateStatus.NO_ACCESS
+
+		old_is_like = post.rate_of(nickname)
+
+		if old_is_like is None:  # User did not like or dislike this post
+			await self.pool.execute("INSERT INTO post_rates(post_id, is_like, nickname) VALUES ($1, $2, $3)", post_id, is_like, nickname)
+		else:
+			await self.pool.execute("UPDATE post_rates SET is_like = $1 WHERE post_id = $2 AND nickname = $3", is_like, post_id, nickname)
+
+		return old_is_like, RateStatus.OK
+
+	async def unset_rate(self, post_id: int, nickname: str) -> tuple[bool | None, RateStatus]:
+		"""Returns previous rate of the user (None if there was none) and status"""
+		post, fetch_status = await self.get_post(post_id)
+		if fetch_status == FetchStatus.POST_DOES_NOT_EXIST:
+			return None, RateStatus.NO_POST
+		elif fetch_status == FetchStatus.UNKNOWN_ERROR:
+			return None, RateStatus.ERROR
+
+		if post.author_nickname == nickname:
+			return None, RateStatus.NO_ACCESS
+
+		await self.pool.execute("DELETE FROM post_rates WHERE post_id = $1 AND nickname = $2", post_id, nickname)
+
+		return post.rate_of(nickname), RateStatus.OK
+
+	async def close(self):
+		if self.pool:
+			await self.pool.close()
@@ -0,0 +1,67 @@
+import asyncio
+import config
+import json
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+	"""Bounded queue of encoded events for one client. If client does not read fast enough, it gets dropped"""
+
+	def __init__(self):
+		self.queue: asyncio.Queue[str | None] = asyncio.Queue(maxsize=config.SSE_QUEUE_SIZE)
+		self.dropped = False
+
+	def drop(self):
+		self.dropped = True
+		# Freeing memory of pending events and waking up the reader with None, which means end of stream
+		while not self.queue.empty():
+			self.queue.get_nowait()
+		self.queue.put_nowait(None)
+
+
+class Hub:
+	"""In-process pub/sub for post events. Events are encoded once per publish, not once per subscriber"""
+
+	def __init__(self):
+		self.subscribers: set[Subscriber] = set()
+		self.version = 0  # Incremented on every change of posts or rates, used to invalidate caches
+
+	def has_subscribers(self) -> bool:
+		return bool(self.subscribers)
+
+	def subscribe(self) -> Subscriber | None:
+		"""Returns None if max amount of subscribers is reached"""
+		if len(self.subscribers) >= config.SSE_MAX_SUBSCRIBERS:
+			return None
+
+		subscriber = Subscriber()
+		self.subscribers.add(subscriber)
+		return subscriber
+
+	def unsubscribe(self, subscriber: Subscriber):
+		self.subscribers.discard(subscriber)
+
+	def changed(self):
+		"""Marks posts as changed without publishing an event"""
+		self.version += 1
+
+	def publish(self, event: str, data: dict):
+		self.changed()
+		if not self.subscribers:
+			return
+
+		message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+		for subscriber in list(self.subscribers):
+			try:
+				subscriber.queue.put_nowait(message)
+			except asyncio.QueueFull:
+				logger.info("dropping slow sse subscriber")
+				self.unsubscribe(subscriber)
+				subscriber.drop()
+
+
+hub = Hub()
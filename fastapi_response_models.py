@@ -1,4 +1,5 @@
 from pydantic import BaseModel
+from database import Post
 import enum
 
 
@@ -26,3 +27,9 @@ class LogOut(Status): ...
 
 class PostCreated(BaseModel):
 	post_id: int
+
+
+class PostsItem(BaseModel):
+	id_: int
+	status: str  # "ok", "post_does_not_exist" or "incorrect_id"
+	post: Post = None
@@ -0,0 +1,40 @@
+import atexit
+import config
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import TextIO
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def setup_logging(stream: TextIO = sys.stderr):
+	"""Configures root logger from config.LOG_LEVEL and config.LOG_LEVELS. Handlers only put records into a queue,
+	writing happens in a background thread, so event loop is never blocked on log I/O"""
+	global _listener
+	if _listener:
+		_listener.stop()
+
+	handler = logging.StreamHandler(stream)
+	handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+	log_queue = queue.SimpleQueue()
+	_listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+	_listener.start()
+
+	root = logging.getLogger()
+	root.handlers = [logging.handlers.QueueHandler(log_queue)]
+	root.setLevel(config.LOG_LEVEL)
+
+	for name, level in config.LOG_LEVELS.items():
+		logging.getLogger(name).setLevel(level)
+
+
+@atexit.register
+def stop_logging():
+	"""Writes out everything left in the queue and stops background thread"""
+	global _listener
+	if _listener:
+		_listener.stop()
+		_listener = None
@@ -1,34 +1,68 @@
-from builtins import print as _print
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import RedirectResponse
+import asyncio
+import contextlib
+import dataclasses
+import json
+import logging
+import secrets
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 import auth as _auth
+import compression
 import config
+import events
+import log
 import messages
+import profiling
+import ranking
 import utils
-from database import Database, User, Post, FetchStatus, AddStatus, RateStatus, EditStatus
+from database import Database, create_database, User, Post, FetchStatus, AddStatus, RateStatus, EditStatus
 import fastapi_response_models as response_models
 # import fastapi_request_models as request_models
 
 # TODO prevent DOS by limiting requests per minute
-if config.DEBUG:
-	print = lambda *args, **kwargs: _print('\033[96m debug *', *args, '\033[0m', **kwargs)
-else:
-	print = lambda *args, **kwargs: None
+log.setup_logging()
+logger = logging.getLogger(__name__)
 
 
-print("Initializing app...")
+logger.debug("Initializing app...")
 app = FastAPI(title=messages.FASTAPI_TITLE, description=messages.FASTAPI_DESCRIPTION, version=messages.FASTAPI_VERSION)
 
 db: Database | None = None
+hot_refresh_task: asyncio.Task | None = None
+init_task: asyncio.Task | None = None
+ready = False  # Becomes True when db and auth key are initialized
 
-print("Initializing auth module...")
-auth = _auth.Auth()
+auth = _auth.Auth()  # Key is loaded on startup, see initialize()
+
+class WaitReadyMiddleware:
+	"""Holds requests until startup initialization is finished, readiness probe is answered right away.
+	If initialization failed, requests are answered with 503"""
+
+	def __init__(self, app):
+		self.app = app
+
+	async def __call__(self, scope, receive, send):
+		if not ready and scope["type"] == "http" and scope["path"] != "/health/ready":
+			await asyncio.shield(init_task)  # Shielded, so disconnected client won't cancel initialization
+			if not ready:
+				await JSONResponse({"detail": messages.INIT_FAILED}, 503)(scope, receive, send)
+				return
+		await self.app(scope, receive, send)
+
+
+app.add_middleware(WaitReadyMiddleware)
+if config.COMPRESSION_ENABLED:
+	app.add_middleware(compression.CompressionMiddleware)
+if config.PROFILING_ENABLED:
+	app.add_middleware(profiling.ProfilingMiddleware)
+	profiling.install()
 
 logged_users: dict[str, list[str]] = {}  # Nickname: jwt token
 token_ip: dict[str, str] = {}
 
 
 # UTIL token validator
+@profiling.traced("token_validation")
 async def token_validation(jwt_token: str, request: Request) -> tuple[dict | HTTPException, bool]:
 	"""Returns either payload from a token or an exception to raise.
 	If second return boolean is False, then token is expired or broken and
@@ -42,7 +76,7 @@ async def token_validation(jwt_token: str, request: Request) -> tuple[dict | HTT
 
 	if decode_status == _auth.DecodeStatus.OK:
 		if config.VALIDATE_IP_OF_SESSION:  # Validating IP if config says so
-			print(client_host, 'validating ip')
+			logger.debug("validating ip %s", client_host)
 			if jwt_token not in token_ip:
 				token_ip[jwt_token] = client_host
 			else:
@@ -59,7 +93,7 @@ async def token_validation(jwt_token: str, request: Request) -> tuple[dict | HTT
 	elif decode_status == _auth.DecodeStatus.INVALID_TOKEN:
 		return HTTPException(400, messages.INVALID_TOKEN), False
 	else:
-		print(f"token_validation exception, jwt_token: {jwt_token}; client host: {client_host}; decode_status {decode_status}")
+		logger.error("token_validation exception, client host: %s; decode_status %s", client_host, decode_status)
 		return HTTPException(405, messages.UNKNOWN_ERROR), False
 
 
@@ -68,6 +102,15 @@ async def docs_redirect():
 	return RedirectResponse(url='/docs')  # redirecting to documentation
 
 
+@app.get("/health/ready", response_model=response_models.Status)
+async def health_ready():
+	"""Readiness probe, responds with 503 until database and auth key are initialized"""
+	if not ready:
+		raise HTTPException(503, messages.NOT_READY)
+
+	return response_models.Status(status=response_models.Status.BasicStatus.OK)
+
+
 # =====================================================================================
 # ================================SESSION MANIPULATIONS================================
 # =====================================================================================
@@ -89,7 +132,7 @@ async def signup(nickname: str, password: str):
 	user = User(nickname=nickname, password=password_, salt=salt)
 
 	res = await db.add_user(user)
-	print(f"added user; nick: {nickname}; password {password_}; salt {salt}")
+	logger.debug("added user %s", nickname)
 
 	if res == AddStatus.OK:
 		token = auth.generate_jwt_token_for_nickname(nickname)
@@ -194,30 +237,53 @@ async def posts_new(jwt_token: str, title: str, content: str, request: Request):
 	if not utils.check_post(title, content):
 		raise HTTPException(400, messages.POST_VALIDATE_ERROR)
 
-	nickname = payload["nickname"]
-	user, fetch_status = await db.get_user(nickname)
-
-	if fetch_status == FetchStatus.OK:
-		post_id, status = await db.add_post(user, title, content)
-		if status == AddStatus.OK:
-			return response_models.PostCreated(post_id=post_id)
-		else:
-			raise HTTPException(400, messages.INVALID_TEXT)
+	# Token is already validated, so nickname is proven and there is no need to fetch the user
+	post, status = await db.add_post(payload["nickname"], title, content)
+	if status == AddStatus.OK:
+		return response_models.PostCreated(post_id=post.id_)
+	elif status == AddStatus.UNKNOWN_ERROR:
+		raise HTTPException(405, messages.UNKNOWN_ERROR)
 	else:
-		raise HTTPException(400, messages.UNKNOWN_ERROR)  # Cuz weve already validated token no chance that nickname does not exist
+		raise HTTPException(400, messages.INVALID_TEXT)
 
 
-@app.get("/posts/get_all")
-async def posts_get_all(limit: int | None = config.POST_MAX_RECEIVE_LIMIT) -> list[Post]:
+@app.get("/posts/get_all", response_model=list[Post])
+async def posts_get_all(request: Request, limit: int | None = config.POST_MAX_RECEIVE_LIMIT):
 	"""Get all newest posts. `limit` argument limits amount of posts fetched (default is set by server config)"""
 	# This method does not require validation, cuz posts are public to fetch
+	encoding = compression.negotiate(request.headers.get("accept-encoding", "")) if config.COMPRESSION_ENABLED else None
+
+	# Feed is serialized and compressed once per change of posts, not once per request
+	cached = compression.feed_cache.get(limit, encoding)
+	if cached:
+		body, used_encoding = cached
+	else:
+		version = events.hub.version
+		posts, fetch_status = await db.get_posts(limit=limit)
 
-	posts, fetch_status = await db.get_posts(limit=limit)
+		if fetch_status == FetchStatus.INCORRECT_LIMIT:
+			raise HTTPException(400, messages.LIMIT_VALIDATE_ERROR)
+		elif fetch_status != FetchStatus.OK:
+			raise HTTPException(405, messages.UNKNOWN_ERROR)
 
-	if fetch_status != FetchStatus.OK:
-		raise HTTPException(405, messages.UNKNOWN_ERROR)
+		with profiling.Span("serialization"):
+			body = json.dumps([dataclasses.asdict(post) for post in posts], ensure_ascii=False, separators=(",", ":")).encode()
+			body, used_encoding = compression.feed_cache.put(version, limit, encoding, body)
+
+	headers = {"Vary": "Accept-Encoding"}
+	if used_encoding:
+		headers["Content-Encoding"] = used_encoding
+	return Response(body, media_type="application/json", headers=headers)
+
+
+@app.get("/posts/hot")
+async def posts_get_hot(limit: int = config.HOT_TOP_K) -> list[Post]:
+	"""Get most popular posts. Rating is based on likes, dislikes and age of a post and is
+	recalculated every few seconds, so fresh votes may appear with a short delay"""
+	if not 1 <= limit <= config.HOT_TOP_K:
+		raise HTTPException(400, messages.HOT_LIMIT_VALIDATE_ERROR)
 
-	return posts
+	return ranking.hot.top[:limit]
 
 
 @app.get("/posts/get")
@@ -232,12 +298,55 @@ async def posts_get(id_: int) -> Post:
 	return post
 
 
+@app.get("/posts/stream")
+async def posts_stream(request: Request):
+	"""Server-sent events feed. Events: `post_new` (full post), `post_edit` (id_, title, content; null if not changed),
+	`post_delete` (id_) and `post_rates` (id_, likes, dislikes). Use it instead of polling /posts/get_all"""
+	subscriber = events.hub.subscribe()
+	if not subscriber:
+		raise HTTPException(503, messages.STREAM_IS_FULL)
+
+	async def event_generator():
+		try:
+			while not await request.is_disconnected():
+				try:
+					message = await asyncio.wait_for(subscriber.queue.get(), timeout=config.SSE_KEEPALIVE_SECONDS)
+				except asyncio.TimeoutError:
+					yield ": keepalive\n\n"
+					continue
+
+				if message is None:  # Subscriber was dropped for being too slow
+					break
+				yield message
+		finally:
+			events.hub.unsubscribe(subscriber)
+
+	return StreamingResponse(event_generator(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/posts/get_many", response_model=list[response_models.PostsItem])
+async def posts_get_many(ids: list[int] = Query()):
+	"""Get several posts by their ids in one request, e.g. `?ids=1&ids=5`. Items are returned in the same order
+	as ids, missing posts are reported by `status` of their item"""
+	items, fetch_status = await db.get_posts_by_ids(ids)
+	if fetch_status == FetchStatus.INCORRECT_LIMIT:
+		raise HTTPException(400, messages.IDS_LIMIT_VALIDATE_ERROR)
+	elif fetch_status != FetchStatus.OK:
+		raise HTTPException(405, messages.UNKNOWN_ERROR)
+
+	# Items are plain dicts, since validation of the response model cloned by FastAPI rejects Post dataclass objects
+	return [
+		{"id_": id_, "status": status.name.lower(), "post": dataclasses.asdict(post) if post else None}
+		for id_, post, status in items
+	]
+
+
 async def rate_post(jwt_token: str, post_id: int, is_like: bool, request: Request):
 	"""Like post as user"""
 	payload, status = await token_validation(jwt_token, request)
 	if not status: raise payload
 
-	rate_result = await db.set_rate(post_id, payload["nickname"], is_like)
+	_, rate_result = await db.set_rate(post_id, payload["nickname"], is_like)
 
 	if rate_result == RateStatus.NO_POST:
 		raise HTTPException(400, messages.POST_DOES_NOT_EXIST)
@@ -267,7 +376,7 @@ async def remove_rate_from_post(jwt_token: str, post_id: int, request: Request):
 	payload, status = await token_validation(jwt_token, request)
 	if not status: raise payload
 
-	rate_result = await db.unset_rate(post_id, payload["nickname"])
+	_, rate_result = await db.unset_rate(post_id, payload["nickname"])
 
 	if rate_result == RateStatus.NO_POST:
 		raise HTTPException(400, messages.POST_DOES_NOT_EXIST)
@@ -288,8 +397,20 @@ async def edit_post(jwt_token: str, post_id: int, request: Request, new_title: s
 	if not new_title and not new_content:
 		return response_models.Status(status=response_models.Status.BasicStatus.ERROR, details="At least specify new_title or new_content")
 
-	await db.edit_post(post_id, payload["nickname"], new_title=new_title, new_content=new_content)
-	return response_models.Status(status=response_models.Status.BasicStatus.OK)
+	status = await db.edit_post(post_id, payload["nickname"], new_title=new_title, new_content=new_content)
+
+	if status == EditStatus.OK:
+		return response_models.Status(status=response_models.Status.BasicStatus.OK)
+	elif status == EditStatus.INVALID_POST:
+		raise HTTPException(400, messages.POST_VALIDATE_ERROR)
+	elif status == EditStatus.INCORRECT_ID:
+		raise HTTPException(400, messages.INVALID_ID)
+	elif status == EditStatus.NO_POST:
+		raise HTTPException(400, messages.POST_DOES_NOT_EXIST)
+	elif status == EditStatus.NO_ACCESS:
+		raise HTTPException(403, messages.NO_ACCESS)
+	else:
+		raise HTTPException(405, messages.UNKNOWN_ERROR)
 
 
 @app.post("/posts/delete", response_model=response_models.Status)
@@ -306,23 +427,75 @@ async def delete_post(jwt_token: str, post_id: int, request: Request):
 	if status == EditStatus.OK:
 		return response_models.Status(status=response_models.Status.BasicStatus.OK)
 	elif status == EditStatus.NO_POST:
-		return HTTPException(400, messages.POST_DOES_NOT_EXIST)
+		raise HTTPException(400, messages.POST_DOES_NOT_EXIST)
 	elif status == EditStatus.NO_ACCESS:
-		return HTTPException(403, messages.NO_ACCESS)
+		raise HTTPException(403, messages.NO_ACCESS)
 	else:
 		raise HTTPException(400, messages.UNKNOWN_ERROR)
 
 
+# =====================================================================================
+# ======================================ADMIN==========================================
+# =====================================================================================
+@app.post("/admin/profile", response_class=PlainTextResponse)
+async def admin_profile(path: str, seconds: float = 10, x_admin_token: str | None = Header(None)):
+	"""Samples event loop stack while requests to `path` are running for `seconds` and responds with folded stacks,
+	which can be rendered by flamegraph.pl or speedscope. Available only if profiling is enabled and admin token is set.
+	Token is passed in `X-Admin-Token` header, so it does not end up in access logs"""
+	if not config.PROFILING_ENABLED or not config.PROFILING_ADMIN_TOKEN:
+		raise HTTPException(404)
+
+	if not x_admin_token or not secrets.compare_digest(x_admin_token, config.PROFILING_ADMIN_TOKEN):
+		raise HTTPException(403, messages.INVALID_ADMIN_TOKEN)
+
+	if not 0 < seconds <= config.PROFILING_MAX_SECONDS:
+		raise HTTPException(400, messages.PROFILING_SECONDS_VALIDATE_ERROR)
+
+	if profiling.sampler:
+		raise HTTPException(409, messages.PROFILING_IS_RUNNING)
+
+	sampler = profiling.sampler = profiling.Sampler(path)
+	sampler.start()
+	try:
+		await asyncio.sleep(seconds)
+	finally:
+		profiling.sampler = None
+
+	return PlainTextResponse(sampler.stop())
+
+
+async def initialize():
+	"""Initializes database and loads auth key concurrently, key loading (or generation) runs in a thread
+	so it does not block the event loop. On failure app stays not ready, see WaitReadyMiddleware"""
+	global db, hot_refresh_task, ready
+	db = create_database()
+	if config.PROFILING_ENABLED:
+		profiling.instrument_database(db.backend)  # Storage itself, so calls between its methods are recorded too
+	logger.info("initializing db and auth key...")
+	try:
+		await asyncio.gather(db.init_database(), asyncio.to_thread(auth.load_key))
+	except Exception:
+		logger.exception("initialization failed, app is not ready")
+		return
+
+	ready = True
+	hot_refresh_task = asyncio.create_task(ranking.hot.run(db))  # Ranking is loaded in background, it is empty until then
+	logger.info("initialized db and auth key, app is ready")
+
+
 @app.on_event("startup")
 async def startup():
-	global db
-	db = Database()
-	print("initializing db...")
-	await db.init_database()
-	print("initialized db")
+	global init_task
+	init_task = asyncio.create_task(initialize())  # Server starts accepting connections without waiting for it
 
 
 @app.on_event("shutdown")
 async def shutdown():
-	print("closing")
-	await db.close()
+	logger.info("closing")
+	init_task.cancel()
+	with contextlib.suppress(asyncio.CancelledError):
+		await init_task  # Db could be connected by now even if initialization is unfinished or failed
+	if hot_refresh_task:
+		hot_refresh_task.cancel()
+	if db:
+		await db.close()
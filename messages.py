@@ -14,12 +14,20 @@ TOKEN_EXPIRED = "This JWT token is expired."
 POST_VALIDATE_ERROR = f"Invalid title or content. Title length must be {config.POST_MIN_TITLE_LENGTH} <= x <= {config.POST_MAX_TITLE_LENGTH}. " \
                       f"Content length must be less than {config.POST_MAX_CONTENT_LENGTH} symbols."
 LIMIT_VALIDATE_ERROR = f"Incorrect limit. It must be 1 <= x <= {config.POST_MAX_RECEIVE_LIMIT}"
+HOT_LIMIT_VALIDATE_ERROR = f"Incorrect limit. It must be 1 <= x <= {config.HOT_TOP_K}"
+IDS_LIMIT_VALIDATE_ERROR = f"Incorrect amount of ids. It must be 1 <= x <= {config.POST_MAX_IDS_PER_REQUEST}"
 INVALID_ID = "Invalid ID. ID must be bigger than 0"
 POST_DOES_NOT_EXIST = "Post of this ID does not exist"
 IP_VALIDATE_ERROR = "IP validation was not passed. Token is now expired."
 NO_ACCESS = "You don't have permission to modify/delete this post since you are not its author"
 NO_ACCESS_RATE = "You cannot like or dislike your own posts"
 RENEW_BEFORE_LOGIN = "You cannot renew token until you log in"
+STREAM_IS_FULL = "Too many clients are connected to the live feed. Retry later."
+NOT_READY = "Server is starting up. Retry later."
+INIT_FAILED = "Server failed to start up. Retry later."
+INVALID_ADMIN_TOKEN = "Invalid admin token"
+PROFILING_IS_RUNNING = "Another profile capture is running. Wait until it is finished."
+PROFILING_SECONDS_VALIDATE_ERROR = f"Incorrect capture length. It must be 0 < x <= {config.PROFILING_MAX_SECONDS} seconds"
 
 # FastAPI messages
 FASTAPI_TITLE = "Social Network by @dredsss"
@@ -0,0 +1,152 @@
+import collections
+import config
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_spans: contextvars.ContextVar[list[tuple[str, float]] | None] = contextvars.ContextVar("profiling_spans", default=None)
+
+
+def traced(name: str):
+	"""Decorator recording duration of a coroutine function as a span of the current request.
+	If profiling is disabled, function is returned as is, so it costs nothing"""
+	def decorator(func):
+		if not config.PROFILING_ENABLED:
+			return func
+
+		@functools.wraps(func)
+		async def wrapper(*args, **kwargs):
+			spans = _spans.get()
+			if spans is None:  # Called outside of a request, e.g. by background task
+				return await func(*args, **kwargs)
+
+			start = time.perf_counter()
+			try:
+				return await func(*args, **kwargs)
+			finally:
+				spans.append((name, time.perf_counter() - start))
+		return wrapper
+	return decorator
+
+
+class Span:
+	"""Context manager recording duration of a code block as a span of the current request"""
+
+	def __init__(self, name: str):
+		self.name = name
+		self.spans = _spans.get()
+
+	def __enter__(self):
+		if self.spans is not None:
+			self.start = time.perf_counter()
+
+	def __exit__(self, *exc):
+		if self.spans is not None:
+			self.spans.append((self.name, time.perf_counter() - self.start))
+
+
+def instrument_database(db):
+	"""Records every public method call of a database backend as `db.<method>` span.
+	Methods calling each other produce nested spans, e.g. db.get_post inside db.set_rate"""
+	for name in dir(db):
+		method = getattr(db, name)
+		if not name.startswith("_") and inspect.iscoroutinefunction(method):
+			setattr(db, name, traced(f"db.{name}")(method))
+
+
+def install():
+	"""Records FastAPI response serialization as `serialization` span"""
+	import fastapi.routing
+
+	# Relies on internals of fastapi~=0.99 (see requirements.txt): routes look serialize_response up in fastapi.routing
+	# module on every request. Recheck this when upgrading fastapi, otherwise the span silently disappears
+	fastapi.routing.serialize_response = traced("serialization")(fastapi.routing.serialize_response)
+
+
+class Sampler:
+	"""Samples stack of the event loop thread while requests to `path` are running and aggregates samples
+	into folded stacks, which can be rendered by flamegraph.pl or speedscope.
+	Samples are not attributed to tasks: the whole thread is sampled, so stacks of concurrent requests to other paths
+	and background tasks get in too. Work done in other threads (e.g. aiosqlite queries) is seen only as the event
+	loop waiting in select"""
+
+	def __init__(self, path: str):
+		self.path = path
+		self.thread_id = threading.get_ident()  # Created from the event loop thread
+		self.active = 0  # Amount of running requests to `path`, changed only by event loop thread
+		self.stacks: collections.Counter[str] = collections.Counter()
+		self.__stop = threading.Event()
+		self.__thread = threading.Thread(target=self.__run, name="profiling-sampler", daemon=True)
+
+	def start(self):
+		self.__thread.start()
+
+	def stop(self) -> str:
+		"""Stops sampling and returns folded stacks, one `frame;frame;frame count` line per unique stack"""
+		self.__stop.set()
+		self.__thread.join()
+		return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+	def __run(self):
+		while not self.__stop.wait(config.PROFILING_SAMPLE_INTERVAL_MS / 1000):
+			if not self.active:
+				continue
+
+			frame = sys._current_frames().get(self.thread_id)
+			stack = []
+			while frame:
+				code = frame.f_code
+				stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+				frame = frame.f_back
+			self.stacks[";".join(reversed(stack))] += 1
+
+
+sampler: Sampler | None = None  # Set while admin capture is running
+
+
+class ProfilingMiddleware:
+	"""Collects spans of every request and logs requests slower than config.PROFILING_SLOW_REQUEST_MS
+	with their spans breakdown. Also counts requests for running Sampler"""
+
+	def __init__(self, app):
+		self.app = app
+
+	async def __call__(self, scope, receive, send):
+		if scope["type"] != "http" or scope["path"] in config.PROFILING_EXCLUDED_PATHS:
+			await self.app(scope, receive, send)
+			return
+
+		spans = []
+		token = _spans.set(spans)
+		sampled = sampler if sampler and sampler.path == scope["path"] else None
+		if sampled:
+			sampled.active += 1
+
+		start = time.perf_counter()
+		try:
+			await self.app(scope, receive, send)
+		finally:
+			total_ms = (time.perf_counter() - start) * 1000
+			_spans.reset(token)
+			if sampled:
+				sampled.active -= 1
+
+			if total_ms >= config.PROFILING_SLOW_REQUEST_MS:
+				logger.warning("slow request %s %s took %.1f ms: %s", scope["method"], scope["path"], total_ms, format_spans(spans))
+
+
+def format_spans(spans: list[tuple[str, float]]) -> str:
+	"""Sums spans by name, e.g. `db.get_posts 12.3 ms x1, token_validation 0.4 ms x1`"""
+	totals = collections.defaultdict(lambda: [0.0, 0])
+	for name, duration in spans:
+		totals[name][0] += duration * 1000
+		totals[name][1] += 1
+
+	return ", ".join(f"{name} {ms:.1f} ms x{count}" for name, (ms, count) in totals.items()) or "no spans"
@@ -0,0 +1,123 @@
+import asyncio
+import config
+import heapq
+import logging
+import math
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+def hot_score(ts_posted: int, likes: int, dislikes: int) -> float:
+	"""Order of magnitude of votes balance plus post time, so every config.HOT_DECAY_SECONDS a newer post
+	needs 10 times less balance to outrank an older one. Score does not change with time, so it is only
+	recalculated when votes of the post change"""
+	balance = likes - dislikes
+	return math.copysign(math.log10(max(abs(balance), 1)), balance) + ts_posted / config.HOT_DECAY_SECONDS
+
+
+class HotIndex:
+	"""In-memory vote counts and scores of posts from the last config.HOT_WINDOW_DAYS and cached top of hottest posts.
+	Counts are maintained incrementally on every local write and reloaded from the database every
+	config.HOT_RELOAD_SECONDS to pick up writes of other workers/hosts. Top is refreshed in the background,
+	so /posts/hot never touches the database"""
+
+	def __init__(self):
+		self.counts: dict[int, list[int]] = {}  # post_id: [ts_posted, likes, dislikes]
+		self.scores: dict[int, float] = {}  # post_id: hot_score
+		self.top: list = []  # database.Post objects, database is not imported since it reports writes to this module
+		self.__heap: list[tuple[float, int]] = []  # (-score, post_id), contains outdated entries, see top_ids()
+		self.__dirty = True  # Set when some post in the top could have changed
+
+	def load(self, rows: list[tuple[int, int, int, int]]):
+		"""Takes (post_id, ts_posted, likes, dislikes) rows. Runs synchronously, so no vote can be applied
+		in the middle, its cost is bounded by config.HOT_WINDOW_DAYS"""
+		self.counts = {post_id: [ts_posted, likes, dislikes] for post_id, ts_posted, likes, dislikes in rows}
+		self.scores = {post_id: hot_score(*counts) for post_id, counts in self.counts.items()}
+		self.__heap = [(-score, post_id) for post_id, score in self.scores.items()]
+		heapq.heapify(self.__heap)
+		self.__dirty = True
+
+	def __update(self, post_id: int):
+		"""Rescores one post. Its old heap entry is left in place and skipped later, since it no longer matches scores"""
+		score = self.scores[post_id] = hot_score(*self.counts[post_id])
+		heapq.heappush(self.__heap, (-score, post_id))
+		self.__dirty = True
+
+		if len(self.__heap) > 2 * len(self.scores) + config.HOT_TOP_K:  # Too many outdated entries, rebuilding
+			self.__heap = [(-score, post_id) for post_id, score in self.scores.items()]
+			heapq.heapify(self.__heap)
+
+	def add_post(self, post_id: int, ts_posted: int):
+		self.counts[post_id] = [ts_posted, 0, 0]
+		self.__update(post_id)
+
+	def edit_post(self, post_id: int):
+		self.__dirty = True
+
+	def delete_post(self, post_id: int):
+		self.counts.pop(post_id, None)
+		self.scores.pop(post_id, None)  # Heap entry becomes outdated
+		self.__dirty = True
+
+	def rate(self, post_id: int, old_is_like: bool | None, new_is_like: bool | None):
+		"""Applies change of one user's rate. None means user had/has no rate on the post"""
+		if post_id not in self.counts or old_is_like == new_is_like:
+			return
+
+		counts = self.counts[post_id]
+		if old_is_like is not None:
+			counts[1 if old_is_like else 2] -= 1
+		if new_is_like is not None:
+			counts[1 if new_is_like else 2] += 1
+		self.__update(post_id)
+
+	def top_ids(self, k: int) -> list[int]:
+		"""Pops best entries from the heap until k up to date ones are found and pushes them back,
+		outdated entries are dropped on the way"""
+		ids = []
+		popped = []
+		while self.__heap and len(ids) < k:
+			entry = heapq.heappop(self.__heap)
+			neg_score, post_id = entry
+			if self.scores.get(post_id) != -neg_score or post_id in ids:
+				continue
+			ids.append(post_id)
+			popped.append(entry)
+
+		for entry in popped:
+			heapq.heappush(self.__heap, entry)
+		return ids
+
+	async def refresh(self, db):
+		if not self.__dirty:  # Scores do not change with time, so top can only change on writes
+			return
+
+		self.__dirty = False
+		ids = self.top_ids(config.HOT_TOP_K)
+		top = []
+		for i in range(0, len(ids), config.POST_MAX_IDS_PER_REQUEST):
+			items, _ = await db.get_posts_by_ids(ids[i:i + config.POST_MAX_IDS_PER_REQUEST])
+			if items is None:  # Database error
+				self.__dirty = True  # Keeping old top until next refresh
+				return
+			top.extend(post for _, post, _ in items if post)  # Post could be deleted meanwhile
+		self.top = top
+
+	async def run(self, db):
+		"""Background loop, runs until cancelled. Loads counts right away and then every config.HOT_RELOAD_SECONDS,
+		refreshes top every config.HOT_REFRESH_SECONDS"""
+		last_load = None
+		while True:
+			try:
+				if last_load is None or time.monotonic() - last_load >= config.HOT_RELOAD_SECONDS:
+					self.load(await db.get_post_scores(round(time.time()) - config.HOT_WINDOW_DAYS * 86400))
+					last_load = time.monotonic()
+				await self.refresh(db)
+			except Exception:  # Loop must survive any error, next iteration will try again
+				logger.exception("hot index refresh failed")
+			await asyncio.sleep(config.HOT_REFRESH_SECONDS)
+
+
+hot = HotIndex()
@@ -0,0 +1,53 @@
+"""Smoke tests of the whole ASGI app, requests go through every middleware like in production"""
+import config
+import main
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+	monkeypatch.setattr(config, "DB_FILENAME", str(tmp_path / "test.sqlite3"))
+	monkeypatch.setattr(config, "KEYPAIR_FILENAME", str(tmp_path / "key.pem"))
+	monkeypatch.setattr(config, "KEYPAIR_SIZE", 1024)  # Generating the key is the slowest part of startup
+
+	async def wait_ready():
+		await main.init_task
+
+	with TestClient(main.app) as client:
+		client.portal.call(wait_ready)
+		yield client
+
+
+def test_ready(client):
+	response = client.get("/health/ready")
+	assert response.status_code == 200
+
+
+def test_get_many(client):
+	post_id = client.portal.call(main.db.add_post, "author", "Title", "Content")[0].id_
+
+	response = client.get("/posts/get_many", params={"ids": [post_id, post_id + 1, 0]})
+	assert response.status_code == 200
+	assert [(item["id_"], item["status"]) for item in response.json()] == [
+		(post_id, "ok"),
+		(post_id + 1, "post_does_not_exist"),
+		(0, "incorrect_id")
+	]
+	assert response.json()[0]["post"]["title"] == "Title"
+	assert response.json()[1]["post"] is None
+
+
+def test_admin_profile_disabled(client, monkeypatch):
+	monkeypatch.setattr(config, "PROFILING_ADMIN_TOKEN", None)
+	assert client.post("/admin/profile", params={"path": "/posts/get_all"}).status_code == 404
+
+
+def test_admin_profile_token(client, monkeypatch):
+	monkeypatch.setattr(config, "PROFILING_ENABLED", True)
+	monkeypatch.setattr(config, "PROFILING_ADMIN_TOKEN", "secret")
+	params = {"path": "/posts/get_all", "seconds": 0.01}
+
+	assert client.post("/admin/profile", params=params).status_code == 403
+	assert client.post("/admin/profile", params=params, headers={"X-Admin-Token": "wrong"}).status_code == 403
+	assert client.post("/admin/profile", params=params, headers={"X-Admin-Token": "secret"}).status_code == 200
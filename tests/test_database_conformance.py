@@ -0,0 +1,161 @@
+"""Every Database backend must return the same statuses for the same calls, see database.Database.
+SQLite runs on a temporary file. PostgreSQL runs only on a dedicated database set by TEST_POSTGRES_DSN environment
+variable, never on config.POSTGRES_DSN, since all its tables are truncated"""
+import asyncio
+import config
+import database
+import os
+import pytest
+from database import User, AddStatus, FetchStatus, EditStatus, RateStatus
+
+
+@pytest.fixture
+def loop():
+	loop = asyncio.new_event_loop()  # Own loop per test, asyncpg pool is bound to the loop it was created in
+	yield loop
+	loop.close()
+
+
+@pytest.fixture
+def run(loop):
+	return loop.run_until_complete
+
+
+@pytest.fixture(params=["sqlite", "postgres"])
+def db(request, run, tmp_path, monkeypatch):
+	if request.param == "sqlite":
+		monkeypatch.setattr(config, "DB_FILENAME", str(tmp_path / "test.sqlite3"))
+		db = database.SQLiteDatabase()
+		run(db.init_database())
+	else:
+		dsn = os.environ.get("TEST_POSTGRES_DSN")
+		if not dsn:
+			pytest.skip("TEST_POSTGRES_DSN is not set")
+
+		database_postgres = pytest.importorskip("database_postgres")
+		monkeypatch.setattr(config, "POSTGRES_DSN", dsn)
+		db = database_postgres.PostgresDatabase()
+		try:
+			run(db.init_database())
+		except Exception as e:
+			run(db.close())
+			pytest.skip(f"PostgreSQL is not reachable: {e}")
+		run(db.pool.execute("TRUNCATE users, posts, post_rates, expired_tokens RESTART IDENTITY"))
+
+	yield db
+	run(db.close())
+
+
+@pytest.fixture
+def post_id(db, run):
+	post, add_status = run(db.add_post("author", "Title", "Content"))
+	assert add_status == AddStatus.OK
+	assert (post.author_nickname, post.title, post.content, post.liked_nicknames) == ("author", "Title", "Content", [])
+	return post.id_
+
+
+def test_add_get_user(db, run):
+	user = User("nickname", b"hash", b"salt")
+	assert run(db.add_user(user)) == AddStatus.OK
+	assert run(db.add_user(user)) == AddStatus.USER_EXISTS
+	assert run(db.add_user(User("bad nickname", b"hash", b"salt"))) == AddStatus.NICKNAME_TOO_LONG
+
+	assert run(db.get_user("nickname")) == (user, FetchStatus.OK)
+	assert run(db.get_user("nobody")) == (None, FetchStatus.USER_DOES_NOT_EXIST)
+
+
+def test_add_get_post(db, run, post_id):
+	post, fetch_status = run(db.get_post(post_id))
+	assert fetch_status == FetchStatus.OK
+	assert (post.id_, post.author_nickname, post.title, post.content) == (post_id, "author", "Title", "Content")
+	assert (post.liked_nicknames, post.disliked_nicknames) == ([], [])
+
+	assert run(db.add_post("author", "", "")) == (None, AddStatus.INVALID_POST)
+	assert run(db.get_post(0)) == (None, FetchStatus.INCORRECT_ID)
+	assert run(db.get_post(post_id + 1)) == (None, FetchStatus.POST_DOES_NOT_EXIST)
+
+
+def test_get_posts(db, run, post_id):
+	newer_id = run(db.add_post("author", "Newer", "Content"))[0].id_
+
+	posts, fetch_status = run(db.get_posts())
+	assert fetch_status == FetchStatus.OK
+	assert [post.id_ for post in posts] == [newer_id, post_id]
+	assert [post.id_ for post in run(db.get_posts(limit=1))[0]] == [newer_id]
+	assert run(db.get_posts(limit=config.POST_MAX_RECEIVE_LIMIT + 1)) == (None, FetchStatus.INCORRECT_LIMIT)
+
+
+def test_get_posts_by_ids(db, run, post_id):
+	other_id = run(db.add_post("author", "Other", "Content"))[0].id_
+	missing_id = other_id + 1
+
+	items, fetch_status = run(db.get_posts_by_ids([other_id, 0, missing_id, post_id, other_id]))
+	assert fetch_status == FetchStatus.OK
+	assert [(id_, post.id_ if post else None, status) for id_, post, status in items] == [
+		(other_id, other_id, FetchStatus.OK),
+		(0, None, FetchStatus.INCORRECT_ID),
+		(missing_id, None, FetchStatus.POST_DOES_NOT_EXIST),
+		(post_id, post_id, FetchStatus.OK),
+		(other_id, other_id, FetchStatus.OK)
+	]
+
+	assert run(db.get_posts_by_ids([])) == (None, FetchStatus.INCORRECT_LIMIT)
+	assert run(db.get_posts_by_ids([post_id] * (config.POST_MAX_IDS_PER_REQUEST + 1))) == (None, FetchStatus.INCORRECT_LIMIT)
+
+
+def test_edit_post(db, run, post_id):
+	assert run(db.edit_post(post_id, "author", new_title="New title")) == EditStatus.OK
+	post, _ = run(db.get_post(post_id))
+	assert (post.title, post.content) == ("New title", "Content")
+
+	assert run(db.edit_post(post_id, "stranger", new_title="Stolen")) == EditStatus.NO_ACCESS
+	assert run(db.edit_post(post_id + 1, "author", new_title="New title")) == EditStatus.NO_POST
+	assert run(db.edit_post(0, "author", new_title="New title")) == EditStatus.INCORRECT_ID
+	assert run(db.edit_post(post_id, "author", new_title="x" * (config.POST_MAX_TITLE_LENGTH + 1))) == EditStatus.INVALID_POST
+	assert run(db.get_post(post_id))[0].title == "New title"
+
+
+def test_delete_post(db, run, post_id):
+	run(db.set_rate(post_id, "reader", True))
+
+	assert run(db.delete_post(post_id, "stranger")) == EditStatus.NO_ACCESS
+	assert run(db.delete_post(0, "author")) == EditStatus.INCORRECT_ID
+	assert run(db.delete_post(post_id, "author")) == EditStatus.OK
+	assert run(db.delete_post(post_id, "author")) == EditStatus.NO_POST
+
+	assert run(db.get_post(post_id)) == (None, FetchStatus.POST_DOES_NOT_EXIST)
+	assert run(db.get_post_scores(0)) == []
+
+
+def test_set_unset_rate(db, run, post_id):
+	# Previous rate of the user is returned along with status
+	assert run(db.set_rate(post_id, "reader", True)) == (None, RateStatus.OK)
+	assert run(db.set_rate(post_id, "critic", False)) == (None, RateStatus.OK)
+	post, _ = run(db.get_post(post_id))
+	assert (post.liked_nicknames, post.disliked_nicknames) == (["reader"], ["critic"])
+	assert run(db.get_rate_counts(post_id)) == (1, 1)
+
+	assert run(db.set_rate(post_id, "reader", False)) == (True, RateStatus.OK)  # Changing existing rate
+	assert run(db.unset_rate(post_id, "critic")) == (False, RateStatus.OK)
+	assert run(db.unset_rate(post_id, "critic")) == (None, RateStatus.OK)
+	post, _ = run(db.get_post(post_id))
+	assert (post.liked_nicknames, post.disliked_nicknames) == ([], ["reader"])
+	assert run(db.get_rate_counts(post_id)) == (0, 1)
+	assert [tuple(row)[2:] for row in run(db.get_post_scores(0))] == [(0, 1)]
+	assert run(db.get_post_scores(post.posted_ts + 1)) == []
+
+	assert run(db.set_rate(post_id, "author", True)) == (None, RateStatus.NO_ACCESS)
+	assert run(db.unset_rate(post_id, "author")) == (None, RateStatus.NO_ACCESS)
+	assert run(db.set_rate(post_id + 1, "reader", True)) == (None, RateStatus.NO_POST)
+	assert run(db.unset_rate(post_id + 1, "reader")) == (None, RateStatus.NO_POST)
+
+
+def test_token_expiry(db, run):
+	assert run(db.check_token_expired("token")) is None
+
+	run(db.expire_token("token"))
+	run(db.expire_token("token"))  # Expiring twice is not an error
+	assert run(db.check_token_expired("token"))
+
+	run(db.clean_expired_tokens())
+	assert run(db.check_token_expired("token")) is None
@@ -0,0 +1,71 @@
+"""NotifyingDatabase reports successful writes of any backend to hot ranking and live feed"""
+import asyncio
+import config
+import database
+import events
+import json
+import pytest
+import ranking
+
+
+@pytest.fixture
+def run():
+	loop = asyncio.new_event_loop()
+	yield loop.run_until_complete
+	loop.close()
+
+
+@pytest.fixture
+def db(run, tmp_path, monkeypatch):
+	monkeypatch.setattr(config, "DB_FILENAME", str(tmp_path / "test.sqlite3"))
+	monkeypatch.setattr(ranking, "hot", ranking.HotIndex())
+	monkeypatch.setattr(events, "hub", events.Hub())
+
+	db = database.NotifyingDatabase(database.SQLiteDatabase())
+	run(db.init_database())
+	yield db
+	run(db.close())
+
+
+def published(subscriber: events.Subscriber) -> list[tuple[str, dict]]:
+	"""Drains subscriber queue into (event, data) pairs"""
+	items = []
+	while not subscriber.queue.empty():
+		event, data = subscriber.queue.get_nowait().strip().split("\n")
+		items.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+	return items
+
+
+def test_writes_are_reported(db, run):
+	subscriber = events.hub.subscribe()
+
+	post, _ = run(db.add_post("author", "Title", "Content"))
+	run(db.set_rate(post.id_, "reader", True))
+	run(db.set_rate(post.id_, "reader", False))
+	assert ranking.hot.counts[post.id_][1:] == [0, 1]
+
+	run(db.edit_post(post.id_, "author", new_title="New title"))
+	run(db.delete_post(post.id_, "author"))
+	assert post.id_ not in ranking.hot.counts
+
+	assert published(subscriber) == [
+		("post_new", {"id_": post.id_, "author_nickname": "author", "title": "Title", "content": "Content",
+		              "posted_ts": post.posted_ts, "liked_nicknames": [], "disliked_nicknames": []}),
+		("post_rates", {"id_": post.id_, "likes": 1, "dislikes": 0}),
+		("post_rates", {"id_": post.id_, "likes": 0, "dislikes": 1}),
+		("post_edit", {"id_": post.id_, "title": "New title", "content": None}),
+		("post_delete", {"id_": post.id_})
+	]
+
+
+def test_failed_writes_are_not_reported(db, run):
+	post, _ = run(db.add_post("author", "Title", "Content"))
+	version = events.hub.version
+
+	run(db.set_rate(post.id_, "author", True))  # Own post
+	run(db.edit_post(post.id_, "stranger", new_title="Stolen"))
+	run(db.delete_post(post.id_ + 1, "author"))
+	assert run(db.add_post("author", "", "")) == (None, database.AddStatus.INVALID_POST)
+
+	assert events.hub.version == version
+	assert ranking.hot.counts == {post.id_: [post.posted_ts, 0, 0]}
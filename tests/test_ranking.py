@@ -0,0 +1,52 @@
+"""HotIndex keeps top of time-invariant scores up to date with per-vote updates"""
+import config
+import pytest
+import ranking
+
+
+@pytest.fixture
+def index() -> ranking.HotIndex:
+	index = ranking.HotIndex()
+	index.load([(1, 1000, 0, 0), (2, 2000, 0, 0), (3, 3000, 0, 0)])
+	return index
+
+
+def test_hot_score():
+	now = 1_700_000_000
+	assert ranking.hot_score(now, 10, 0) > ranking.hot_score(now, 1, 0) == ranking.hot_score(now, 0, 0) > ranking.hot_score(now, 0, 10)
+	# Newer post with 10 times less balance catches up after HOT_DECAY_SECONDS
+	assert ranking.hot_score(now + config.HOT_DECAY_SECONDS, 10, 0) == pytest.approx(ranking.hot_score(now, 100, 0))
+	# Disliked post keeps sinking below newer ones
+	assert ranking.hot_score(now, 0, 10) < ranking.hot_score(now + 1, 0, 10)
+
+
+def test_top_ids_follow_votes(index):
+	assert index.top_ids(3) == [3, 2, 1]
+
+	for _ in range(100):
+		index.rate(1, None, True)
+	for _ in range(10):
+		index.rate(3, None, False)
+	assert index.top_ids(3) == [1, 2, 3]
+
+	index.rate(1, True, None)  # Single vote does not change the order of magnitude much
+	assert index.top_ids(2) == [1, 2]
+
+
+def test_top_ids_skip_outdated_entries(index):
+	index.rate(2, None, True)
+	index.rate(2, True, None)  # Back to the same score, heap has duplicate entries of the post
+	index.delete_post(3)
+	index.add_post(4, 500)
+
+	assert index.top_ids(10) == [2, 1, 4]
+	assert index.top_ids(10) == [2, 1, 4]  # Popped entries are pushed back
+
+
+def test_outdated_entries_are_compacted(index):
+	for _ in range(10 * config.HOT_TOP_K):
+		index.rate(1, None, True)
+		index.rate(1, True, None)
+
+	assert len(index._HotIndex__heap) <= 2 * len(index.scores) + config.HOT_TOP_K
+	assert index.top_ids(3) == [3, 2, 1]